@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 
 import argparse
+from array import array
+import bisect
+import codecs
+from concurrent.futures import ProcessPoolExecutor
 import contextlib
 import csv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import functools
 import os
-import xml.etree.ElementTree as ET
+import shutil
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+from xml.parsers import expat
 
 
 # Formats for parsing datetimes from GPX and CSV files (may be device-specific)
@@ -13,28 +21,113 @@ GPX_DATE_FMTS = ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S.%fZ")
 CSV_DATE_FMTS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%SZ")
 
 
+# Times are stored as integer microseconds since the epoch
+# (the parsed times are naive so they're just treated as UTC)
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
 # XML Namespaces
 ns = {
     "gpx": "http://www.topografix.com/GPX/1/1",
     "gpxtpx": "http://www.garmin.com/xmlschemas/TrackPointExtension/v1",
 }
 
+# Fully-qualified element names as reported by expat ("<uri> <localname>")
+NAME_TRK = "{gpx} trk".format(**ns)
+NAME_TRKSEG = "{gpx} trkseg".format(**ns)
+NAME_TRKPT = "{gpx} trkpt".format(**ns)
+NAME_TIME = "{gpx} time".format(**ns)
+NAME_EXT = "{gpx} extensions".format(**ns)
+NAME_TPE = "{gpxtpx} TrackPointExtension".format(**ns)
+NAME_HR = "{gpxtpx} hr".format(**ns)
+
+# Path to the trackpoints (relative to the root element)
+TRKPT_PATH = [NAME_TRK, NAME_TRKSEG, NAME_TRKPT]
+
+# An edit to make to the GPX file to add HR data to a trackpoint
+# (offset, length, template, container) - see TrackpointScanner
+Edit = Tuple[int, int, str, Optional[str]]
+
+# Encodings that are determined by the byte order mark at the start of a file
+BOMS = {b"\xff\xfe": "utf-16-le", b"\xfe\xff": "utf-16-be"}
+
+# Byte order of UTF-16 files without a BOM, determined by how the "<?" at the
+# start of the XML declaration is encoded (see appendix F of the XML spec)
+UTF16_DECLS = {b"<\x00?\x00": "utf-16-le", b"\x00<\x00?": "utf-16-be"}
 
-def parse_datetime(s, fmts):
-    for fmt in fmts:
+# Size of the chunks to use when copying data between files
+COPY_BUFSIZE = 64 * 1024
+
+
+# Index of the format that last successfully parsed a timestamp (keyed by the
+# tuple of formats). Files almost always use a single format throughout so
+# trying it first avoids a failed strptime (and exception) for every row.
+_fmt_hints: Dict[Tuple[str, ...], int] = {}
+
+
+def parse_datetime(s: str, fmts: Tuple[str, ...]) -> datetime:
+    hint = _fmt_hints.get(fmts, 0)
+    for i in range(len(fmts)):
+        idx = (hint + i) % len(fmts)
         with contextlib.suppress(ValueError):
-            return datetime.strptime(s, fmt)
+            dt = datetime.strptime(s, fmts[idx])
+            _fmt_hints[fmts] = idx
+            return dt
     raise ValueError("Timestamp '{}' not in a recognized format ({})", s, " / ".join(fmts))
 
 
-def load_hr_data(hr_filename):
-    """Load HR data from a file into a list of (time, hr) tuples
+# Timestamps are commonly repeated (multiple samples per second, overlapping
+# files, etc) so cache the results of parsing them
+@functools.lru_cache(maxsize=4096)
+def parse_iso_datetime(s: str, fmts: Tuple[str, ...]) -> datetime:
+    """Parse an ISO 8601-shaped timestamp, falling back to the listed formats
+
+    `datetime.fromisoformat` is implemented in C and is much faster than
+    `strptime`. All of the configured formats are ISO-shaped so it should
+    handle practically every timestamp (a trailing "Z" is stripped first since
+    the parsed times are naive anyway).
+
+    Timestamps with a UTC offset are converted to naive UTC times.
+    """
+    with contextlib.suppress(ValueError):
+        dt = datetime.fromisoformat(s[:-1] if s.endswith("Z") else s)
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return dt
+    return parse_datetime(s, fmts)
+
+
+def to_timestamp(dt: datetime) -> int:
+    """Convert a datetime into integer microseconds since the epoch"""
+    return (dt - EPOCH) // MICROSECOND
+
+
+def iso_key(s: str) -> Optional[str]:
+    """Normalize a "YYYY-MM-DD[T ]HH:MM:SS[Z]" timestamp into a string that can
+    be compared with others directly (without parsing it)
+
+    Returns None for timestamps in any other format.
+    """
+    if len(s) == 20 and s[-1] == "Z":
+        s = s[:19]
+    if len(s) == 19 and s[10] in " T":
+        return s[:10] + "T" + s[11:]
+    return None
+
+
+def load_hr_data(hr_filename: str) -> Tuple[array, array, Dict[str, int]]:
+    """Load HR data from a file into parallel arrays of times and HRs
 
     Expects a CSV file with (date, hr) pairs
     Expects dates to be formated according to one of CSV_DATE_FMTS
+
+    The returned arrays are sorted by time (as timestamps) so they can be
+    searched using the `bisect` module. Also returns a mapping of normalized
+    timestamp strings (see `iso_key`) to HRs for finding exact matches without
+    having to parse the timestamps.
     """
     # TODO: autodetect and support other common formats?
-    data = []
     with open(hr_filename, "rt", newline="") as f:
         reader = csv.reader(f)
 
@@ -45,78 +138,335 @@ def load_hr_data(hr_filename):
         next(rows)
 
         # Process the data into a time -> hr mapping
-        for row in rows:
-            data.append((parse_datetime(row[0], CSV_DATE_FMTS), int(row[1])))
-    return sorted(data)
+        data = sorted(
+            ((to_timestamp(parse_iso_datetime(row[0], CSV_DATE_FMTS)), int(row[1]), iso_key(row[0])) for row in rows),
+            key=lambda x: x[:2],
+        )
+    return (
+        array("q", (t for t, _, _ in data)),
+        array("h", (hr for _, hr, _ in data)),
+        {key: hr for _, hr, key in data if key is not None},
+    )
 
 
-def get_time(trkpt):
-    """Get the time for the trackpoint
+def parse_gpx_time(time: str) -> int:
+    """Parse the time of a trackpoint into a timestamp
 
     Expects dates to be formatted according to one of GPX_DATE_FMTS
     """
-    time = trkpt.find("gpx:time", ns).text
-    return parse_datetime(time, GPX_DATE_FMTS)
+    if len(time) == 20 and time[-1] == "Z":
+        # Fast path for the canonical "YYYY-MM-DDTHH:MM:SSZ" format
+        # Trackpoint times are practically unique so there's no point caching them
+        with contextlib.suppress(ValueError):
+            return to_timestamp(datetime.fromisoformat(time[:19]))
+    return to_timestamp(parse_iso_datetime(time, GPX_DATE_FMTS))
+
+
+# Documents only use a handful of distinct element names so only split each once
+@functools.lru_cache(maxsize=None)
+def split_name(name: str) -> Tuple[str, str]:
+    """Split a name reported by expat into the fully-qualified name and the
+    name as it appears in the document (including any prefix)
+    """
+    parts = name.split(" ")
+    if len(parts) == 3:
+        return parts[0] + " " + parts[1], parts[2] + ":" + parts[1]
+    return name, parts[-1]
+
+
+def with_prefix(qname: str, local: str) -> str:
+    """Make a name that uses the same prefix as the qname"""
+    prefix, sep, _ = qname.rpartition(":")
+    return prefix + sep + local
 
 
-def set_hr(trkpt, value):
-    """Set the heart rate for the trackpoint
+class TrackpointScanner:
+    """Find the trackpoints in a GPX file using a streaming parser
+
+    For each trackpoint with a time, records the time and an edit describing
+    where in the file its HR data should go. This allows the HR data to be
+    spliced into a copy of the original file without having to load the entire
+    document into memory or re-serialize it.
+
+    Edits are (offset, length, template, container) tuples. The `length` bytes
+    at `offset` in the file should be replaced with `template.format(hr)`. If
+    the template is being inserted into an element that has no content,
+    `container` is set to its name since it may be self-closing and need to be
+    expanded (see `write_gpx`).
+
+    Any existing HR data is replaced. Otherwise, any required intermediary
+    elements are added.
+
+    Since the offsets are byte positions in the file, the data being spliced in
+    has to be encoded the same way as the file is (see `encoding`).
+    """
 
-    Adds any required intermediary elements.
+    def __init__(self) -> None:
+        self.points: List[Tuple[str, Edit]] = []
+        self.encoding = "utf-8"
+
+        self._stack: List[str] = []  # names of the currently-open elements
+        self._prefixes: Dict[Optional[str], List[str]] = {}  # prefix -> URIs bound to it (innermost last)
+
+        # State of the current trackpoint
+        self._depth = 0  # depth of the trackpoint (0 if not in one)
+        self._time: Optional[List[str]] = None
+        self._in_time = False
+        self._ext = self._tpe = self._hr = False
+        self._in_ext = self._in_tpe = self._in_hr = False
+        self._hr_text: Optional[int] = None
+        self._edit: Optional[Edit] = None
+
+        # If the innermost open element has any content
+        self._content = False
+
+        self._parser = expat.ParserCreate(namespace_separator=" ")
+        self._parser.namespace_prefixes = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+        self._parser.StartCdataSectionHandler = self._start_cdata
+        self._parser.StartNamespaceDeclHandler = self._start_ns
+        self._parser.EndNamespaceDeclHandler = self._end_ns
+        self._parser.XmlDeclHandler = self._xml_decl
+
+    def scan(self, f) -> List[Tuple[str, Edit]]:
+        """Scan the binary file and return a list of (time, edit) tuples"""
+        # The byte order of UTF-16 files has to be determined from the start
+        # of the file (Python's "utf-16" codec would add a BOM to each encoded
+        # snippet)
+        head = f.read(4)
+        f.seek(0)
+        self._parser.ParseFile(f)
+        if head[:2] in BOMS:
+            self.encoding = BOMS[head[:2]]
+        elif codecs.lookup(self.encoding).name == "utf-16":
+            if head not in UTF16_DECLS:
+                raise ValueError("Unable to determine the byte order of the UTF-16 encoded file")
+            self.encoding = UTF16_DECLS[head]
+        return self.points
+
+    def _xml_decl(self, version: str, encoding: Optional[str], standalone: int) -> None:
+        if encoding:
+            self.encoding = encoding
+
+    def _start_ns(self, prefix: Optional[str], uri: str) -> None:
+        self._prefixes.setdefault(prefix, []).append(uri)
+
+    def _end_ns(self, prefix: Optional[str]) -> None:
+        self._prefixes[prefix].pop()
+
+    def _tpe_template(self) -> str:
+        """Template for a new TrackPointExtension element containing the HR"""
+        uris = self._prefixes.get("gpxtpx")
+        if uris and uris[-1] == ns["gpxtpx"]:
+            decl = ""
+        else:
+            decl = ' xmlns:gpxtpx="{gpxtpx}"'.format(**ns)
+        return "<gpxtpx:TrackPointExtension{}><gpxtpx:hr>{{}}</gpxtpx:hr></gpxtpx:TrackPointExtension>".format(decl)
+
+    def _start(self, name: str, attrs: Dict[str, str]) -> None:
+        name, _ = split_name(name)
+        self._stack.append(name)
+        self._content = False
+        depth = len(self._stack)
+
+        if not self._depth:
+            # Only look at trackpoints at "gpx/trk/trkseg/trkpt"
+            if name == NAME_TRKPT and self._stack[1:] == TRKPT_PATH:
+                self._depth = depth
+                self._time = None
+                self._ext = self._tpe = self._hr = False
+                self._hr_text = None
+                self._edit = None
+            return
+
+        # Only the first of each element is used
+        if depth == self._depth + 1:
+            if name == NAME_TIME and self._time is None:
+                self._time = []
+                self._in_time = True
+            elif name == NAME_EXT and not self._ext:
+                self._ext = self._in_ext = True
+        elif depth == self._depth + 2 and self._in_ext:
+            if name == NAME_TPE and not self._tpe:
+                self._tpe = self._in_tpe = True
+        elif depth == self._depth + 3 and self._in_tpe:
+            if name == NAME_HR and not self._hr:
+                self._hr = self._in_hr = True
+
+    def _end(self, name: str) -> None:
+        self._stack.pop()
+        empty, self._content = not self._content, True
+        if not self._depth:
+            return
+
+        _, qname = split_name(name)
+        container = qname if empty else None
+        depth = len(self._stack) + 1
+        offset = self._parser.CurrentByteIndex
+
+        # Record where the HR data should go using the deepest existing
+        # element (the innermost element ends first)
+        if self._in_hr and depth == self._depth + 3:
+            self._in_hr = False
+            if self._hr_text is not None:
+                self._edit = (self._hr_text, offset - self._hr_text, "{}", None)
+            else:
+                self._edit = (offset, 0, "{}", container)
+        elif self._in_tpe and depth == self._depth + 2:
+            self._in_tpe = False
+            if self._edit is None:
+                self._edit = (offset, 0, "<{0}>{{}}</{0}>".format(with_prefix(qname, "hr")), container)
+        elif self._in_ext and depth == self._depth + 1:
+            self._in_ext = False
+            if self._edit is None:
+                self._edit = (offset, 0, self._tpe_template(), container)
+        elif self._in_time and depth == self._depth + 1:
+            self._in_time = False
+        elif depth == self._depth:
+            self._depth = 0
+            if self._edit is None:
+                self._edit = (
+                    offset,
+                    0,
+                    "<{0}>{1}</{0}>".format(with_prefix(qname, "extensions"), self._tpe_template()),
+                    container,
+                )
+            # Trackpoints without a time can't be matched up with HR data
+            if self._time is not None:
+                self.points.append(("".join(self._time).strip(), self._edit))
+
+    def _start_cdata(self) -> None:
+        # Replacing existing HR text has to include the start of any CDATA
+        # section (the character data inside it is reported after the "<![CDATA[")
+        self._content = True
+        if self._in_hr and self._hr_text is None:
+            self._hr_text = self._parser.CurrentByteIndex
+
+    def _data(self, data: str) -> None:
+        self._content = True
+        if self._in_time and self._time is not None:
+            self._time.append(data)
+        elif self._in_hr and self._hr_text is None:
+            self._hr_text = self._parser.CurrentByteIndex
+
+
+def scan_gpx(gpx_file: str) -> Tuple[List[Tuple[str, Edit]], str]:
+    """Find the time of each trackpoint in the GPX file and where to put its HR data
+
+    Returns the list of (time, edit) tuples and the encoding of the file.
     """
-    ext = trkpt.find("gpx:extensions", ns)
-    if ext is None:
-        ext = ET.SubElement(trkpt, "{{{gpx}}}extensions".format(**ns))
-    tpe = ext.find("gpxtpx:TrackPointExtension", ns)
-    if tpe is None:
-        tpe = ET.SubElement(ext, "{{{gpxtpx}}}TrackPointExtension".format(**ns))
-    hr = tpe.find("gpxtpx:hr", ns)
-    if hr is None:
-        hr = ET.SubElement(tpe, "{{{gpxtpx}}}hr".format(**ns))
+    scanner = TrackpointScanner()
+    with open(gpx_file, "rb") as f:
+        return scanner.scan(f), scanner.encoding
+
+
+def copy_bytes(src, dst, length: int) -> None:
+    """Copy length bytes from the src file to the dst file"""
+    while length > 0:
+        chunk = src.read(min(length, COPY_BUFSIZE))
+        if not chunk:
+            break
+        dst.write(chunk)
+        length -= len(chunk)
 
-    hr.text = str(value)
 
+def write_gpx(orig_gpx: str, gpx_file: str, edits: List[Tuple[Edit, int]], encoding: str) -> None:
+    """Write a copy of the original GPX file with the HR data spliced in
 
-def binary_search_lerp(time, hr_data, max_interpolate=None):
-    """Perform a binary search for the time in the HR data
+    Expects a list of (edit, hr) tuples in file order and the encoding of the
+    file. Everything else is copied over as-is.
+    """
+    self_closing = "/>".encode(encoding)
+    with open(orig_gpx, "rb") as src, open(gpx_file, "wb") as dst:
+        pos = 0
+        for (offset, length, template, container), hr in edits:
+            data = template.format(hr).encode(encoding)
+            if container is not None:
+                # Inserting into an empty element - expand it if it's self-closing (`<container/>`)
+                copy_bytes(src, dst, offset - len(self_closing) - pos)
+                end = src.read(len(self_closing))
+                if end == self_closing:
+                    data = ">{}</{}>".format(template.format(hr), container).encode(encoding)
+                else:
+                    dst.write(end)
+            else:
+                copy_bytes(src, dst, offset - pos)
+            src.seek(length, os.SEEK_CUR)
+            dst.write(data)
+            pos = offset + length
+
+        shutil.copyfileobj(src, dst)
+
+
+def lerp_hr(
+    idx: int, time: int, hr_times: Sequence[int], hr_values: Sequence[int], max_interpolate: Optional[int] = None
+) -> Optional[int]:
+    """Get the HR at the time, given the index of the last HR time <= the time
 
     Use linear interpolation (within the max_interpolate param) to return a
     value if no exact results exist.
-    """
-    min_, max_, i = 0, len(hr_data) - 1, None
-    while min_ <= max_:
-        idx = (min_ + max_) // 2
-        if hr_data[idx][0] == time:
-            # exact match - return it
-            return hr_data[idx][1]
-        elif hr_data[idx][0] < time:
-            min_ = idx + 1
-        else:
-            max_ = idx - 1
 
-    # No exact match
-    # Make sure index is always on the lower bound
-    if hr_data[idx][0] > time:
-        idx -= 1
+    All times (including max_interpolate) are integer timestamps.
+    """
+    if idx >= 0 and hr_times[idx] == time:
+        # exact match - return it
+        return hr_values[idx]
 
     # Don't interpolate missing data
-    if not (0 <= idx < len(hr_data) - 1):
+    if not (0 <= idx < len(hr_times) - 1):
         return None
 
-    (time1, hr1), (time2, hr2) = hr_data[idx:idx+2]
+    time1, time2 = hr_times[idx], hr_times[idx+1]
+    hr1, hr2 = hr_values[idx], hr_values[idx+1]
 
     # Only interpolate if it's within range, otherwise return no data
-    if max_interpolate is not None and min(time-time1, time2-time).total_seconds() > max_interpolate:
+    if max_interpolate is not None and min(time-time1, time2-time) > max_interpolate:
         return None
 
-    return round(hr1 + (hr2-hr1) * ((time-time1) / (time2-time1)))
+    # Interpolate using integer math, rounding half to even like round() does
+    hr, rem = divmod(hr1 * (time2-time1) + (hr2-hr1) * (time-time1), time2-time1)
+    if rem * 2 > time2-time1 or (rem * 2 == time2-time1 and hr % 2):
+        hr += 1
+    return hr
+
+
+def lookup_hrs(
+    times: Sequence[int], hr_times: Sequence[int], hr_values: Sequence[int], max_interpolate: Optional[int] = None
+) -> List[Optional[int]]:
+    """Look up the HR for each of the times in a single batch
+
+    Returns a list of HRs (or None if no data is available) that lines up
+    with the provided times.
+    """
+    # The HR data and trackpoints are usually recorded at the same (whole
+    # second) times so most lookups will be exact matches
+    hr_map = dict(zip(hr_times, hr_values))
+
+    # Both the trackpoint times and the HR data are (almost always) in
+    # increasing order so walk through them together instead of searching.
+    # `idx` is kept at the index of the last HR time <= the current time.
+    hrs: List[Optional[int]] = []
+    idx, num = -1, len(hr_times)
+    for t in times:
+        hr = hr_map.get(t)
+        if hr is None:
+            if idx >= 0 and t < hr_times[idx]:
+                # Time went backwards - search for the new position
+                idx = bisect.bisect_right(hr_times, t) - 1
+            while idx + 1 < num and hr_times[idx + 1] <= t:
+                idx += 1
+            hr = lerp_hr(idx, t, hr_times, hr_values, max_interpolate)
+        hrs.append(hr)
+    return hrs
 
 
 def merge(gpx_file, hr_file, interpolate):
 
     print("Merging heart rate date from {} into {}...".format(hr_file, gpx_file))
     # Read in the hr_data
-    hr_data = load_hr_data(hr_file)
+    hr_times, hr_values, hr_by_key = load_hr_data(hr_file)
 
     if not os.path.exists(gpx_file):
         raise Exception("GPX file {} does not exist".format(gpx_file))
@@ -127,24 +477,31 @@ def merge(gpx_file, hr_file, interpolate):
         raise Exception("Backup of '{}' already exists".format(gpx_file))
     os.rename(gpx_file, orig_gpx)
 
-    # Register namespaces to use when writing the document
-    ET.register_namespace("", ns["gpx"])  # "" to use it as the default namespace
-    ET.register_namespace("gpxtpx", ns["gpxtpx"])
     try:
-        # Read in the document
-        gpx = ET.parse(orig_gpx)
-
-        # Iterate over all the trackpoints
-        for trkpt in gpx.iterfind("./gpx:trk/gpx:trkseg/gpx:trkpt", ns):
-            # Use the point data to look up the HR from the CSV
-            # Will interpolate a value if no exact match is found
-            point_time = get_time(trkpt)
-            hr_at_time = binary_search_lerp(point_time, hr_data, max_interpolate=1 if not interpolate else None)
-            if hr_at_time:
-                set_hr(trkpt, hr_at_time)
-
-        # Write the document out
-        gpx.write(gpx_file, xml_declaration=True, encoding="UTF-8")
+        # Find all the trackpoints and their times
+        points, encoding = scan_gpx(orig_gpx)
+
+        # Most trackpoints will exactly match the time of some HR data so
+        # first try to match them up without parsing the times at all
+        hrs = [hr_by_key.get(iso_key(time)) for time, _ in points]
+
+        # Use the times of the rest of the points to look up the HRs from the CSV
+        # Will interpolate a value if no exact match is found
+        missing = [i for i, hr in enumerate(hrs) if hr is None]
+        max_interpolate = timedelta(seconds=1) // MICROSECOND if not interpolate else None
+        point_times = [parse_gpx_time(points[i][0]) for i in missing]
+        for i, hr in zip(missing, lookup_hrs(point_times, hr_times, hr_values, max_interpolate=max_interpolate)):
+            hrs[i] = hr
+
+        edits = [(edit, hr) for (_, edit), hr in zip(points, hrs) if hr]
+        if not edits:
+            # Nothing to change, just move the original file back
+            os.rename(orig_gpx, gpx_file)
+            print("No matching heart rate data found - {} was not modified".format(gpx_file))
+            return
+
+        # Write the document back out with the HR data added
+        write_gpx(orig_gpx, gpx_file, edits, encoding)
     except Exception:
         # Something went wrong, move the backup file back
         os.rename(orig_gpx, gpx_file)
@@ -156,12 +513,37 @@ def main():
     parser = argparse.ArgumentParser(
         description="Merge HR data from a CSV into a GPX file"
     )
-    parser.add_argument("--gpx", help="The GPX file to modify", required=True)
+    parser.add_argument("--gpx", help="The GPX file(s) to modify", nargs="+", required=True)
     parser.add_argument("--hr", help="The heart rate data file", required=True)
     parser.add_argument("--interpolate", help="Interpolate missing heart rate data?", action="store_true")
     args = parser.parse_args()
 
-    merge(gpx_file=args.gpx, hr_file=args.hr, interpolate=args.interpolate)
+    # Merging into the same file more than once at the same time would clash
+    unique_files = {}
+    for gpx_file in args.gpx:
+        unique_files.setdefault(os.path.realpath(gpx_file), gpx_file)
+    gpx_files = list(unique_files.values())
+
+    if len(gpx_files) == 1:
+        merge(gpx_file=gpx_files[0], hr_file=args.hr, interpolate=args.interpolate)
+        return
+
+    # Each file is independent so merge them in parallel
+    with ProcessPoolExecutor() as executor:
+        futures = [
+            (gpx_file, executor.submit(merge, gpx_file=gpx_file, hr_file=args.hr, interpolate=args.interpolate))
+            for gpx_file in gpx_files
+        ]
+
+    # Report every file that failed, not just the first one
+    failed = 0
+    for gpx_file, future in futures:
+        exc = future.exception()
+        if exc is not None:
+            print("Failed to merge heart rate data into {}: {}".format(gpx_file, exc), file=sys.stderr)
+            failed += 1
+    if failed:
+        parser.exit(1, "Failed to merge heart rate data into {} of {} files\n".format(failed, len(gpx_files)))
 
 
 if __name__ == "__main__":
@@ -10,11 +10,15 @@ setup(
     license="GPLv3",
     classifiers=[
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
+        "Programming Language :: Python :: Implementation :: CPython",
+        "Programming Language :: Python :: Implementation :: PyPy",
     ],
+    python_requires=">=3.8",
     py_modules=["gpx_hr_merge"],
     entry_points={"console_scripts": ["gpx-hr-merge=gpx_hr_merge:main"]},
 )